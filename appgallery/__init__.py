@@ -31,6 +31,11 @@ Updating and submitting your app:
     my_app.update_app_file_info(lang='en_US', filetype=utils.FT_APK_OR_RPK, file_info=file_info)
     my_app.submit_for_release()
 
+Working with several accounts:
+    with appgallery.ClientPool([first_credentials, second_credentials], calls=10) as pool:
+        futures = pool.map(lambda client: client.query_app(package_name='com.example.app'))
+        apps = { client_id: future.result() for client_id, future in futures.items() }
+
 '''
-from appgallery.api import Client
+from appgallery.api import Client, ClientPool
 import appgallery.utils as utils
\ No newline at end of file
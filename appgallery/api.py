@@ -2,11 +2,15 @@
 
 __author__ = 'healplease'
 
+import os
 import json
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import requests
 
-from .utils import AccessToken, Credentials, Upload, Message, AppInfo, AuditInfo, LangInfo, FileInfo, HuaweiException
+from .utils import AccessToken, Credentials, RateLimit, Upload, Message, AppInfo, AuditInfo, LangInfo, FileInfo, HuaweiException
 
 class App():
     '''This class represents App.
@@ -121,29 +125,77 @@ class Client():
 
     You can obtain your `client_id` and `client_secret` in your AppGallery cabinet.
     
-    `grant_type` must have value of `client_credentials`.'''
+    `grant_type` must have value of `client_credentials`.
+
+    `session` is a `requests.Session` to send requests through; pass the same session to several clients
+    to share connections between them. `rate_limit` is a `RateLimit` applied to every request of this client.'''
     API_URL = 'https://connect-api.cloud.huawei.com/api'
-    def __init__(self, client_id: str=None, client_secret: str=None, grant_type: str=None):
+    def __init__(self, client_id: str=None, client_secret: str=None, grant_type: str=None, session: requests.Session=None, rate_limit: RateLimit=None):
         self.credentials = Credentials(client_id, client_secret, grant_type)
+        self.session = session if session else requests.Session()
+        self.rate_limit = rate_limit
+        self._local = threading.local()
+        self._token_lock = threading.Lock()
+        self.token = None
         self.obtain_token()
 
-    def obtain_token(self):
-        '''This method is for obtaining the token for access to other AppGallery functions.
-        
-        You don't need to call it yourself: it's obtaining and refreshing on expire automatically.'''
+    @property
+    def last_response(self):
+        '''The last response received by the current thread.'''
+        return getattr(self._local, 'last_response', None)
+
+    @last_response.setter
+    def last_response(self, response: requests.Response):
+        self._local.last_response = response
+
+    def _request(self, method: str, url: str, headers=None, **kwargs):
+        '''`headers` is a callable: it's called after waiting for the rate limit, so the token is checked right before sending.'''
+        if self.rate_limit:
+            self.rate_limit.wait()
+        return self.session.request(method, url, headers=headers() if headers else None, **kwargs)
+
+    def _fetch_token(self):
         url = Client.API_URL + '/oauth2/v1/token'
         data = {
             'grant_type': self.credentials.grant_type,
             'client_id': self.credentials.client_id,
             'client_secret': self.credentials.client_secret,
         }
-        self.last_response = requests.post(url, json=data)
+        self.last_response = self._request('post', url, json=data)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             self.token = AccessToken(response_parsed)
         else:
             raise requests.RequestException(f'Unsuccessful request. Error code: {self.last_response.status_code}')
 
+    def _ensure_token(self):
+        if self.token is None or self.token.is_expired():
+            with self._token_lock:
+                if self.token is None or self.token.is_expired():
+                    self._fetch_token()
+
+    def _auth_headers(self):
+        self._ensure_token()
+        return {
+            'client_id': self.credentials.client_id,
+            'Authorization': self.token.auth()
+        }
+
+    def _token_headers(self):
+        self._ensure_token()
+        return {
+            'client_id': self.credentials.client_id,
+            'token': self.token.token
+        }
+
+    def obtain_token(self):
+        '''This method is for obtaining the token for access to other AppGallery functions.
+        
+        You don't need to call it yourself: it's obtaining and refreshing on expire automatically.
+        Calling it forces a new token even if the current one is still valid.'''
+        with self._token_lock:
+            self._fetch_token()
+
     def query_app(self, package_name: str):
         '''Use this method to gain the list of App() instances. 
         
@@ -152,13 +204,7 @@ class Client():
         data = {
             'packageName': package_name
         }
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.get(url, params=data, headers=headers)
+        self.last_response = self._request('get', url, params=data, headers=self._auth_headers)
         print(self.last_response.text)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
@@ -194,13 +240,7 @@ class Client():
         if release_type:
             data.update({ 'releaseType': release_type })
 
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.get(url, params=data, headers=headers)
+        self.last_response = self._request('get', url, params=data, headers=self._auth_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
@@ -232,13 +272,7 @@ class Client():
         if release_type:
             data.update({ 'releaseType': release_type })
 
-        headers = {
-            'client_id': self.credentials.client_id,
-            'token': self.token.token
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.put(url, data=data, headers=headers)
+        self.last_response = self._request('put', url, data=data, headers=self._token_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
@@ -276,13 +310,7 @@ class Client():
         if lang.new_features:
             body.update({ 'newFeatures': lang.newFeatures })
 
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.put(url, json=body, headers=headers)
+        self.last_response = self._request('put', url, json=body, headers=self._auth_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
@@ -302,13 +330,7 @@ class Client():
             'appId': app.id,
             'lang': lang if isinstance(lang, str) else lang.lang
         }
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.delete(url, data=data, headers=headers)
+        self.last_response = self._request('delete', url, data=data, headers=self._auth_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
@@ -338,21 +360,15 @@ class Client():
             'appId': app.id,
             'suffix': extension
         }
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.delete(url, data=data, headers=headers)
+        self.last_response = self._request('delete', url, data=data, headers=self._auth_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
             if message.code > 0:
                 raise HuaweiException(response_parsed.get('ret'))
             else:
-                app.upload = Upload(response_parsed)
-                return Upload(response_parsed)
+                app.upload = Upload(response_parsed, self._request)
+                return Upload(response_parsed, self._request)
         else:
             raise requests.RequestException(f'Unsuccessful request. Error code: {self.last_response.status_code}')
 
@@ -376,13 +392,7 @@ class Client():
         }
         body.update(kwargs)
 
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.put(url, json=body, headers=headers)
+        self.last_response = self._request('put', url, json=body, headers=self._auth_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
@@ -409,13 +419,7 @@ class Client():
         if channel_ID:
             data.update({ 'channelId': channel_ID })
 
-        headers = {
-            'client_id': self.credentials.client_id,
-            'Authorization': self.token.auth()
-        }
-        if self.token.is_expired():
-            self.obtain_token()
-        self.last_response = requests.post(url, data=data, headers=headers)
+        self.last_response = self._request('post', url, data=data, headers=self._auth_headers)
         if self.last_response.status_code == 200:
             response_parsed = json.loads(self.last_response.text)
             message = Message(response_parsed)
@@ -424,4 +428,116 @@ class Client():
             else:
                 return None
         else:
-            raise requests.RequestException(f'Unsuccessful request. Error code: {self.last_response.status_code}')
\ No newline at end of file
+            raise requests.RequestException(f'Unsuccessful request. Error code: {self.last_response.status_code}')
+
+class ClientPool():
+    '''This class holds clients for several developer accounts at once.
+
+    All clients share one connection pool and one thread pool, while every account keeps its own
+    `Credentials`, `AccessToken` and `RateLimit` (`calls` requests per `period` seconds, unlimited if `calls` is not set).
+
+    `credentials` is a list of dicts with `client_id`, `client_secret` and `grant_type` keys, same as in credentials JSON file.
+    Every dict must have its own `client_id`: missing or duplicate ids raise `ValueError`. Other missing keys
+    are taken from os.environ['HUAWEI_CREDENTIALS_PATH'] the same way as for `Client`.
+
+    One account holds at most `account_workers` threads at a time (by default `max_workers` split evenly between
+    accounts), the rest of its work waits in the account's own queue. So an account that ran out of its rate limit
+    doesn't delay work of other accounts.
+
+    Work submitted to the pool must not wait for other futures of the same pool:
+    once all `max_workers` threads are blocked this way, the pool deadlocks.
+    
+    Example of usage:
+        with appgallery.ClientPool([first_credentials, second_credentials], calls=10) as pool:
+            futures = pool.map(lambda client: client.query_app(package_name='com.example.app'))
+            apps = { client_id: future.result() for client_id, future in futures.items() }'''
+    def __init__(self, credentials: list, max_workers: int=None, calls: int=None, period: float=1.0, account_workers: int=None):
+        client_ids = [x.get('client_id') for x in credentials]
+        if not all(client_ids):
+            raise ValueError('Every credential set must have `client_id`')
+        if len(set(client_ids)) != len(client_ids):
+            raise ValueError('Duplicate `client_id` in credentials')
+
+        self.max_workers = max_workers if max_workers else min(32, (os.cpu_count() or 1) + 4)
+        self.account_workers = account_workers if account_workers else max(1, self.max_workers // max(1, len(client_ids)))
+        self._queues = { x: deque() for x in client_ids }
+        self._running = { x: 0 for x in client_ids }
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        try:
+            futures = [self.executor.submit(Client, session=self.session, rate_limit=RateLimit(calls, period) if calls else None, **x) for x in credentials]
+            self.clients = { client.credentials.client_id: client for client in (x.result() for x in futures) }
+        except BaseException:
+            self.close()
+            raise
+
+    def __getitem__(self, client_id: str):
+        return self.clients[client_id]
+
+    def __iter__(self):
+        return iter(self.clients.values())
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _dispatch(self, client_id: str):
+        queue = self._queues[client_id]
+        while queue and self._running[client_id] < self.account_workers:
+            self._running[client_id] += 1
+            self.executor.submit(self._run, client_id, *queue.popleft())
+
+    def _run(self, client_id: str, future: Future, fn, args: tuple, kwargs: dict):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(self.clients[client_id], *args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            with self._condition:
+                self._running[client_id] -= 1
+                self._dispatch(client_id)
+                self._condition.notify_all()
+
+    def submit(self, client_id: str, fn, *args, **kwargs):
+        '''Use this method to schedule `fn(client, *args, **kwargs)` for the client of specified account.
+        
+        Returns `concurrent.futures.Future`. `fn` must not block on other futures of this pool.'''
+        if client_id not in self.clients:
+            raise KeyError(client_id)
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('cannot schedule new futures after close')
+            self._queues[client_id].append((future, fn, args, kwargs))
+            self._dispatch(client_id)
+        return future
+
+    def map(self, fn, *args, **kwargs):
+        '''Use this method to schedule `fn(client, *args, **kwargs)` for every account of the pool.
+        
+        Returns dict of `concurrent.futures.Future` by `client_id`. `fn` must not block on other futures of this pool.'''
+        return { client_id: self.submit(client_id, fn, *args, **kwargs) for client_id in self.clients }
+
+    def close(self):
+        '''Waits for all scheduled work to finish and closes the connections.'''
+        with self._condition:
+            self._closed = True
+            self._condition.wait_for(lambda: not any(self._running.values()))
+        self.executor.shutdown(wait=True)
+        self.session.close()
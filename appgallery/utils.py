@@ -5,6 +5,8 @@ __author__ = 'healplease'
 import os
 import json
 import time
+import threading
+from collections import deque
 
 import requests
 
@@ -44,9 +46,11 @@ class Credentials():
 
 
 class AccessToken():
+    EXPIRY_MARGIN = 60
     def __init__(self, parsed: dict):
         self.token = parsed.get('access_token')
         self.expires_in = int(parsed.get('expires_in'))
+        self.expires_at = time.time() + self.expires_in
 
     def __repr__(self):
         return self.token
@@ -55,10 +59,34 @@ class AccessToken():
         return 'Bearer {}'.format(self.token)
 
     def is_expired(self):
-        return time.time() > self.expires_in
+        '''Token is considered expired `EXPIRY_MARGIN` seconds early, so it doesn't expire on the way to the server.'''
+        return time.time() > self.expires_at - AccessToken.EXPIRY_MARGIN
+
+class RateLimit():
+    '''Limits the number of requests made by one client to `calls` per `period` seconds.
+    
+    Thread-safe: one instance can be shared by all threads that work with the same account.'''
+    def __init__(self, calls: int, period: float=1.0):
+        self.calls = calls
+        self.period = period
+        self._timestamps = deque()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        '''Blocks until the next request fits into the budget.'''
+        with self._lock:
+            now = time.monotonic()
+            while self._timestamps and now - self._timestamps[0] >= self.period:
+                self._timestamps.popleft()
+            if len(self._timestamps) >= self.calls:
+                time.sleep(self.period - (now - self._timestamps[0]))
+                self._timestamps.popleft()
+            self._timestamps.append(time.monotonic())
 
 class Upload():
-    def __init__(self, parsed: dict):
+    '''`request` is a callable with signature of `requests.request`; `Client` passes its own to share session and rate limit.'''
+    def __init__(self, parsed: dict, request=None):
+        self.request = request if request else requests.request
         self.URL = parsed.get('uploadUrl')
         self.chunk_URL = parsed.get('chunkUploadUrl')
         self.verification_code = parsed.get('authCode')
@@ -77,8 +105,8 @@ class Upload():
             'file': open(filepath, 'rb')
         }
 
-        self.last_response = requests.post(self.URL, data, files=files)
-        response = json.loads(self.last_response.text, encoding='utf-8')
+        self.last_response = self.request('post', self.URL, data=data, files=files)
+        response = json.loads(self.last_response.text)
         if self.last_response.status_code == 200:
             info = response.get('result').get('UploadFileRsp').get('fileInfoList')
             return FileInfo(info[0])
@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+
+from appgallery.api import Client, ClientPool
+
+
+def make_response(parsed: dict, status_code: int=200):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.text = json.dumps(parsed)
+    return response
+
+
+class FakeSession():
+    '''Answers token requests with `<client_id>-<n>` tokens and echoes Authorization header as appid.'''
+    def __init__(self):
+        self.token_requests = 0
+        self.requests = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        if url.endswith('/oauth2/v1/token'):
+            with self.lock:
+                self.token_requests += 1
+                count = self.token_requests
+            client_id = kwargs['json']['client_id']
+            if client_id == 'broken':
+                return make_response({}, status_code=401)
+            return make_response({ 'access_token': f'{client_id}-{count}', 'expires_in': 3600 })
+        self.requests.append((method, url, kwargs))
+        return make_response({ 'appids': [{ 'key': 'com.example.app', 'value': kwargs['headers']['Authorization'] }] })
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def make_client(session: FakeSession=None, **kwargs):
+    return Client('id', 'secret', 'client_credentials', session=session if session else FakeSession(), **kwargs)
+
+
+class ClientTokenTest(unittest.TestCase):
+    def test_expired_token_is_refreshed_before_request(self):
+        client = make_client()
+        client.token.expires_at = time.time() - 1
+        apps = client.query_app('com.example.app')
+        self.assertEqual(apps[0].id, 'Bearer id-2')
+
+    def test_token_expired_while_waiting_for_rate_limit_is_refreshed(self):
+        rate_limit = mock.Mock()
+        client = make_client(rate_limit=rate_limit)
+
+        def expire():
+            client.token.expires_at = time.time() - 1
+
+        rate_limit.wait.side_effect = expire
+        apps = client.query_app('com.example.app')
+        self.assertEqual(apps[0].id, 'Bearer id-2')
+
+    def test_valid_token_is_reused(self):
+        session = FakeSession()
+        client = make_client(session)
+        client.query_app('com.example.app')
+        client.query_app('com.example.app')
+        self.assertEqual(session.token_requests, 1)
+
+    def test_concurrent_refresh_fetches_token_once(self):
+        session = FakeSession()
+        client = make_client(session)
+        client.token.expires_at = time.time() - 1
+        threads = [threading.Thread(target=client.query_app, args=('com.example.app',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(session.token_requests, 2)
+
+    def test_obtain_token_forces_refresh(self):
+        session = FakeSession()
+        client = make_client(session)
+        client.obtain_token()
+        self.assertEqual(session.token_requests, 2)
+        self.assertEqual(client.token.token, 'id-2')
+
+    def test_last_response_is_per_thread(self):
+        client = make_client()
+        responses = {}
+
+        def worker():
+            client.query_app('com.example.app')
+            responses['worker'] = client.last_response
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsNotNone(responses['worker'])
+        self.assertIsNot(client.last_response, responses['worker'])
+
+    def test_upload_goes_through_client_session(self):
+        session = FakeSession()
+        client = make_client(session)
+        upload_response = make_response({ 'result': { 'UploadFileRsp': { 'fileInfoList': [{ 'fileDestUlr': 'https://cdn/file.apk', 'size': 1 }] } } })
+        session.request = mock.Mock(return_value=make_response({ 'uploadUrl': 'https://upload', 'authCode': 'code' }))
+        upload = client.obtain_upload_URL(mock.Mock(id='1'), 'apk')
+        session.request.return_value = upload_response
+        with mock.patch('builtins.open', mock.mock_open(read_data=b'apk')):
+            file_info = upload.upload_file('package.apk')
+        self.assertEqual(file_info.name, 'file.apk')
+        self.assertEqual(session.request.call_args[0][:2], ('post', 'https://upload'))
+
+
+class ClientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        patcher = mock.patch('appgallery.api.requests.Session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def credentials(self, *client_ids):
+        return [{ 'client_id': x, 'client_secret': 'secret', 'grant_type': 'client_credentials' } for x in client_ids]
+
+    def test_map_runs_for_every_account_with_own_token(self):
+        with ClientPool(self.credentials('first', 'second'), max_workers=2) as pool:
+            futures = pool.map(lambda client: client.query_app('com.example.app'))
+            tokens = { client_id: future.result()[0].id for client_id, future in futures.items() }
+        self.assertEqual(set(tokens), { 'first', 'second' })
+        self.assertTrue(tokens['first'].startswith('Bearer first-'))
+        self.assertTrue(tokens['second'].startswith('Bearer second-'))
+
+    def test_clients_share_session(self):
+        with ClientPool(self.credentials('first', 'second')) as pool:
+            self.assertEqual(len(pool), 2)
+            self.assertTrue(all(client.session is self.session for client in pool))
+
+    def test_submit_runs_for_specified_account(self):
+        with ClientPool(self.credentials('first', 'second')) as pool:
+            future = pool.submit('second', lambda client: client.credentials.client_id)
+            self.assertEqual(future.result(), 'second')
+
+    def test_close_shuts_down_executor(self):
+        pool = ClientPool(self.credentials('first'))
+        pool.close()
+        with self.assertRaises(RuntimeError):
+            pool.submit('first', lambda client: None)
+
+    def test_duplicate_client_id_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ClientPool(self.credentials('first', 'first'))
+
+    def test_missing_client_id_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ClientPool([{ 'client_secret': 'secret', 'grant_type': 'client_credentials' }])
+
+    def test_limited_account_does_not_block_other_accounts(self):
+        with ClientPool(self.credentials('a', 'b'), max_workers=4, calls=2, period=1.0) as pool:
+            for _ in range(6):
+                pool.submit('a', lambda client: client.query_app('com.example.app'))
+            start = time.monotonic()
+            pool.submit('b', lambda client: client.query_app('com.example.app')).result()
+            self.assertLess(time.monotonic() - start, 0.3)
+
+    def test_close_waits_for_queued_work(self):
+        with ClientPool(self.credentials('first'), max_workers=1) as pool:
+            futures = [pool.submit('first', time.sleep, 0.01) for _ in range(5)]
+        self.assertTrue(all(x.done() for x in futures))
+
+    def test_failed_token_closes_pool(self):
+        executors = []
+
+        def make_executor(*args, **kwargs):
+            executors.append(ThreadPoolExecutor(*args, **kwargs))
+            return executors[-1]
+
+        with mock.patch('appgallery.api.ThreadPoolExecutor', side_effect=make_executor):
+            with self.assertRaises(requests.RequestException):
+                ClientPool(self.credentials('first', 'broken'))
+        with self.assertRaises(RuntimeError):
+            executors[0].submit(lambda: None)
+        self.assertTrue(self.session.closed)
@@ -0,0 +1,35 @@
+import time
+import unittest
+
+from appgallery.utils import AccessToken, RateLimit
+
+
+class AccessTokenTest(unittest.TestCase):
+    def test_fresh_token_is_not_expired(self):
+        token = AccessToken({ 'access_token': 'abc', 'expires_in': 3600 })
+        self.assertFalse(token.is_expired())
+
+    def test_token_expires_after_lifetime(self):
+        token = AccessToken({ 'access_token': 'abc', 'expires_in': 3600 })
+        token.expires_at = time.time() - 1
+        self.assertTrue(token.is_expired())
+
+    def test_token_is_expired_shortly_before_lifetime_ends(self):
+        token = AccessToken({ 'access_token': 'abc', 'expires_in': 30 })
+        self.assertTrue(token.is_expired())
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_calls_within_budget_do_not_wait(self):
+        rate_limit = RateLimit(5, 1.0)
+        start = time.monotonic()
+        for _ in range(5):
+            rate_limit.wait()
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_calls_over_budget_wait_for_period(self):
+        rate_limit = RateLimit(2, 0.2)
+        start = time.monotonic()
+        for _ in range(5):
+            rate_limit.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)